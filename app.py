@@ -1,8 +1,15 @@
-from flask import Flask, render_template, request, redirect, session, flash
+from flask import Flask, render_template, request, redirect, session, flash, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-import json, os
+import json, os, threading, time, uuid
+from contextlib import contextmanager
 from datetime import datetime
+from functools import wraps
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+import reports
 
 app = Flask(__name__)
 app.secret_key = "secret123"
@@ -11,6 +18,9 @@ DB = "database.json"
 MEDICAL_DB = "medical_db.json"
 UPLOAD_FOLDER = os.path.join('static','uploads')
 ALLOWED_EXTENSIONS = {'png','jpg','jpeg','gif'}
+DEDUP_WINDOW = 120  # seconds in which repeat complaints/SOS from one user collapse into one record
+DEDUP_SCAN = 50  # how many of the newest complaints are checked for a repeat
+REPORT_MAX_AGE = 300  # seconds before /admin/reports triggers a background rebuild
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -60,28 +70,99 @@ STATE_DISTRICT_MAP = {
     "Lakshadweep": ["Kavaratti"]
 }
 
+# lookup tables derived from the reference data above; read them via _index()
+_indexes = {}
+
+def build_indexes():
+    _indexes['stations'] = {str(s['id']): s for s in POLICE_STATIONS}
+    _indexes['stations_json'] = json.dumps(POLICE_STATIONS)
+    _indexes['state_districts_json'] = json.dumps(STATE_DISTRICT_MAP)
+
+def _index(name):
+    if not _indexes:
+        build_indexes()
+    return _indexes[name]
+
 # ---------------- DATABASE ----------------
-def load_db():
-    if not os.path.exists(DB):
-        with open(DB,'w') as f:
-            json.dump({"users":{}, "complaints":[], "medicines":[], "orders":[]},f)
-    with open(DB) as f:
+_gevent_hub = None
+
+def _offload(fn, *args):
+    # under gevent workers (see gunicorn.conf.py) file I/O would stall every
+    # connection on the event loop, so run it on the hub's thread pool instead
+    global _gevent_hub
+    if _gevent_hub is None:
+        try:
+            from gevent import monkey, get_hub
+            _gevent_hub = get_hub if monkey.is_module_patched('socket') else False
+        except ImportError:
+            _gevent_hub = False
+    if not _gevent_hub:
+        return fn(*args)
+    return _gevent_hub().threadpool.apply(fn, args)
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        with open(path,'w') as f:
+            json.dump(default,f)
+    with open(path) as f:
         return json.load(f)
 
-def save_db(data):
-    with open(DB,'w') as f:
+def _write_json(path, data):
+    # write then rename so concurrent readers never see a half-written file
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp,'w') as f:
         json.dump(data,f,indent=4)
+    os.replace(tmp, path)
+
+# load -> modify -> save must not interleave: the RLock serializes greenlets and
+# threads in this worker, flock on a side file serializes the other workers.
+# Created at import, i.e. after gevent's monkey-patching (no preload_app).
+_db_lock = threading.RLock()
+_db_lock_state = {'depth': 0, 'file': None}
+
+@contextmanager
+def db_lock():
+    with _db_lock:
+        if _db_lock_state['depth'] == 0 and fcntl:
+            f = open(DB + '.lock', 'a')
+            try:
+                _offload(fcntl.flock, f.fileno(), fcntl.LOCK_EX)
+            except Exception:
+                f.close()
+                raise
+            _db_lock_state['file'] = f
+        _db_lock_state['depth'] += 1
+        try:
+            yield
+        finally:
+            _db_lock_state['depth'] -= 1
+            f = _db_lock_state['file']
+            if _db_lock_state['depth'] == 0 and f:
+                _db_lock_state['file'] = None
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                f.close()
+
+def serialized_writes(view):
+    # every write happens on POST; hold db_lock across the whole view
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'POST':
+            return view(*args, **kwargs)
+        with db_lock():
+            return view(*args, **kwargs)
+    return wrapper
+
+def load_db():
+    return _offload(_read_json, DB, {"users":{}, "complaints":[], "medicines":[], "orders":[]})
+
+def save_db(data):
+    _offload(_write_json, DB, data)
 
 def load_medical_db():
-    if not os.path.exists(MEDICAL_DB):
-        with open(MEDICAL_DB,'w') as f:
-            json.dump({"stores":[]},f)
-    with open(MEDICAL_DB) as f:
-        return json.load(f)
+    return _offload(_read_json, MEDICAL_DB, {"stores":[]})
 
 def save_medical_db(data):
-    with open(MEDICAL_DB,'w') as f:
-        json.dump(data,f,indent=4)
+    _offload(_write_json, MEDICAL_DB, data)
 
 # ---------------- HELPERS ----------------
 def login_required(role=None):
@@ -90,6 +171,60 @@ def login_required(role=None):
     if role and session['role'] != role:
         return "Unauthorized"
 
+def station_by_id(station_id):
+    return _index('stations').get(str(station_id))
+
+def find_by_idempotency_key(records, key):
+    # a record keeps every key folded into it; newest first, as a replayed
+    # form is almost always a recent submission
+    if not key:
+        return None
+    return next((r for r in reversed(records) if key in r.get('idempotency_keys', ())), None)
+
+def add_complaint(db, user, text, station_id, idempotency_key=None):
+    """Append a complaint unless it replays or repeats a recent one.
+
+    Returns (record, outcome) where outcome is 'created', 'merged' or
+    'replayed'. A replayed idempotency key returns the original record
+    untouched; a repeat of a pending complaint from the same user, type and
+    station within DEDUP_WINDOW bumps that record's repeat_count instead.
+    """
+    complaints = db['complaints']
+    existing = find_by_idempotency_key(complaints, idempotency_key)
+    if existing is not None:
+        return existing, 'replayed'
+
+    now = datetime.now()
+    kind = 'SOS' if text == 'SOS' else 'complaint'
+    station_id = station_id or None
+    for c in complaints[-DEDUP_SCAN:]:
+        last = c.get('last_at') or c.get('created_at')
+        if not last or (now - datetime.fromisoformat(last)).total_seconds() > DEDUP_WINDOW:
+            continue
+        same_kind = ('SOS' if c.get('text') == 'SOS' else 'complaint') == kind
+        # distinct complaint texts are distinct reports, never merge them
+        if (c.get('user') == user and same_kind and (c.get('station') or None) == station_id
+                and c.get('status') == 'Pending' and (kind == 'SOS' or c.get('text') == text)):
+            c['repeat_count'] = c.get('repeat_count', 1) + 1
+            c['last_at'] = now.isoformat(timespec='seconds')
+            if idempotency_key:
+                c.setdefault('idempotency_keys', []).append(idempotency_key)
+            return c, 'merged'
+
+    st = station_by_id(station_id) if station_id else None
+    record = {
+        "user": user,
+        "text": text,
+        "station": station_id,
+        "station_name": st['name'] if st else None,
+        "status": "Pending",
+        "created_at": now.isoformat(timespec='seconds'),
+        "idempotency_keys": [idempotency_key] if idempotency_key else [],
+        "repeat_count": 1
+    }
+    complaints.append(record)
+    return record, 'created'
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.',1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -109,6 +244,10 @@ def calculate_age(dob_str):
         return ""
 
 
+@app.template_global()
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
 @app.context_processor
 def inject_sos_alerts():
     try:
@@ -118,6 +257,79 @@ def inject_sos_alerts():
     except:
         return dict(sos_alerts=[], sos_count=0)
 
+# ---------------- WARMUP ----------------
+WARMUP_RETRY_AFTER = 30  # seconds before a failed warmup is tried again
+_warm = {'ready': False, 'warmed_at': None, 'seconds': None, 'error': None, 'failed_at': None}
+
+def data_version():
+    # cheap change marker for the two JSON stores: mtime and size of each
+    parts = []
+    for path in (DB, MEDICAL_DB):
+        try:
+            st = os.stat(path)
+            parts.append("%d-%d" % (st.st_mtime_ns, st.st_size))
+        except OSError:
+            parts.append("missing")
+    return ":".join(parts)
+
+def warmup():
+    """Pay the first-request costs up front; run before the worker takes traffic.
+
+    A failure is recorded in _warm (and shown by /readyz) before re-raising.
+    """
+    started = time.time()
+    try:
+        _warm_steps()
+    except Exception as e:
+        _warm.update(error="%s: %s" % (type(e).__name__, e), failed_at=time.time())
+        raise
+    _warm.update(ready=True, warmed_at=datetime.now().isoformat(timespec='seconds'),
+                 seconds=round(time.time() - started, 3), error=None, failed_at=None)
+
+def _warm_steps():
+    # nothing caches the parsed DBs (every request re-reads them); this only
+    # creates missing files and pulls them into the OS page cache
+    load_db()
+    load_medical_db()
+    build_indexes()
+    for name in app.jinja_env.list_templates(filter_func=lambda n: n.endswith('.html')):
+        app.jinja_env.get_template(name)
+    # first scrypt call allocates its working memory
+    check_password_hash(generate_password_hash('warmup'), 'warmup')
+
+_warmup_lock = threading.Lock()
+
+@app.before_request
+def warmup_on_first_request():
+    # gunicorn.conf.py warms workers before they accept traffic; any other
+    # server (flask run, a different -c) gets warmed by its first request
+    if _warm['ready'] or request.endpoint == 'healthz':
+        return
+    # after a failure, don't rerun the whole warmup on every request
+    if _warm['failed_at'] and time.time() - _warm['failed_at'] < WARMUP_RETRY_AFTER:
+        return
+    # concurrent first requests don't queue behind the one doing the warmup
+    if not _warmup_lock.acquire(blocking=False):
+        return
+    try:
+        if not _warm['ready']:
+            warmup()
+    except Exception:
+        app.logger.exception("warmup failed")
+    finally:
+        _warmup_lock.release()
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(status="ok")
+
+@app.route('/readyz')
+def readyz():
+    body = dict(_warm, data_version=data_version())
+    if _warm['ready']:
+        return jsonify(status="ready", **body)
+    return jsonify(status="failed" if _warm['error'] else "warming", **body), 503
+
 # ---------------- ROUTES ----------------
 @app.route('/')
 def home():
@@ -125,6 +337,7 @@ def home():
 
 # -------- AUTH --------
 @app.route('/signup',methods=['GET','POST'])
+@serialized_writes
 def signup():
     db=load_db()
     if request.method=="POST":
@@ -225,6 +438,7 @@ def profile():
 
 
 @app.route('/profile/edit', methods=['GET','POST'])
+@serialized_writes
 def edit_profile():
     if 'username' not in session:
         return redirect('/login')
@@ -307,6 +521,7 @@ def edit_profile():
     return render_template('profile_edit.html', username=user, profile=profile)
 
 @app.route('/complete_profile',methods=['GET','POST'])
+@serialized_writes
 def complete_profile():
     if 'username' not in session:
         return redirect('/login')
@@ -392,26 +607,17 @@ def complete_profile():
 
 # -------- SAFETY --------
 @app.route('/safety',methods=['GET','POST'])
+@serialized_writes
 def safety():
     check=login_required("User")
     if check: return check
     db=load_db()
     if request.method=="POST":
-        text = request.form.get('text')
-        station_id = request.form.get('station')
-        station_name = None
-        if station_id:
-            st = next((s for s in POLICE_STATIONS if str(s['id'])==str(station_id)), None)
-            if st:
-                station_name = st['name']
-        db['complaints'].append({
-            "user":session['username'],
-            "text": text,
-            "station": station_id,
-            "station_name": station_name,
-            "status":"Pending"
-        })
-        save_db(db)
+        _, outcome = add_complaint(db, session['username'], request.form.get('text'),
+                                   request.form.get('station'), request.form.get('idempotency_key'))
+        # replays of the same form are not written again
+        if outcome != 'replayed':
+            save_db(db)
     return render_template("safety.html",complaints=db['complaints'])
 
 
@@ -423,32 +629,21 @@ def safety_nearby():
 
 
 @app.route('/safety/complaint', methods=['GET','POST'])
+@serialized_writes
 def safety_complaint():
     check = login_required('User')
     if check: return check
     db = load_db()
     if request.method=='POST':
-        station = request.form.get('station')
-        text = request.form.get('text')
-        station_name = None
-        if station:
-            st = next((s for s in POLICE_STATIONS if str(s['id'])==str(station)), None)
-            if st:
-                station_name = st['name']
-        db['complaints'].append({
-            'user': session['username'],
-            'text': text,
-            'station': station,
-            'station_name': station_name,
-            'status': 'Pending'
-        })
-        save_db(db)
-        flash('Complaint filed', 'success')
+        _, outcome = add_complaint(db, session['username'], request.form.get('text'),
+                                   request.form.get('station'), request.form.get('idempotency_key'))
+        if outcome != 'replayed':
+            save_db(db)
+        flash('Complaint filed' if outcome == 'created' else 'Complaint already filed', 'success')
         return redirect('/safety/status')
 
     # pass stations JSON for client-side compose
-    import json as _json
-    return render_template('file_complaint.html', stations=POLICE_STATIONS, stations_json=_json.dumps(POLICE_STATIONS), username=session.get('username'))
+    return render_template('file_complaint.html', stations=POLICE_STATIONS, stations_json=_index('stations_json'), username=session.get('username'))
 
 
 @app.route('/safety/status')
@@ -461,6 +656,7 @@ def safety_status():
 
 # -------- SHOP (FIXED ROUTE) --------
 @app.route('/shop',methods=['GET','POST'])
+@serialized_writes
 def shop():
     check=login_required("User")
     if check: return check
@@ -474,16 +670,21 @@ def shop():
         return redirect('/complete_profile')
 
     if request.method=="POST":
-        db['orders'].append({
-            "user":session['username'],
-            "medicine":request.form.get('med')
-        })
-        save_db(db)
+        key = request.form.get('idempotency_key')
+        # a re-submitted order form must not order the medicine twice
+        if find_by_idempotency_key(db['orders'], key) is None:
+            db['orders'].append({
+                "user":session['username'],
+                "medicine":request.form.get('med'),
+                "idempotency_keys":[key] if key else []
+            })
+            save_db(db)
 
     return render_template("shop.html",medicines=db['medicines'])
 
 # -------- POLICE --------
 @app.route('/police',methods=['GET','POST'])
+@serialized_writes
 def police():
     check=login_required("Police")
     if check: return check
@@ -542,6 +743,7 @@ def police():
         try:
             i=int(request.form.get('resolve_id'))
             db['complaints'][i]['status']="Resolved"
+            db['complaints'][i]['resolved_at']=datetime.now().isoformat(timespec='seconds')
             save_db(db)
             # remember which complaint was just resolved so template can auto-expand it
             session['just_resolved'] = i
@@ -558,13 +760,13 @@ def police():
 
     just_resolved = session.pop('just_resolved', None)
 
-    import json as _json
-    state_districts_json = _json.dumps(STATE_DISTRICT_MAP)
+    state_districts_json = _index('state_districts_json')
 
     return render_template("police_dashboard.html", complaints=complaints, pending=pending, resolved=resolved, locations=locations, just_resolved=just_resolved, state_districts_json=state_districts_json)
 
 
 @app.route('/police/portal', methods=['GET','POST'])
+@serialized_writes
 def police_portal():
     # public portal for station login
     if request.method == 'POST':
@@ -576,8 +778,8 @@ def police_portal():
             flash('All fields required','error')
             return render_template('police_portal.html')
 
-        st = next((s for s in POLICE_STATIONS if str(s['id'])==str(station_id) and s['email']==station_email), None)
-        if not st:
+        st = station_by_id(station_id)
+        if not st or st['email'] != station_email:
             flash('Station ID or email not found','error')
             return render_template('police_portal.html')
 
@@ -605,6 +807,7 @@ def police_portal():
 
 # -------- MEDICAL --------
 @app.route('/medical',methods=['GET','POST'])
+@serialized_writes
 def medical():
     check=login_required("Medical")
     if check: return check
@@ -672,6 +875,7 @@ def medical_orders():
 
 
 @app.route('/medical/details', methods=['GET','POST'])
+@serialized_writes
 def medical_details():
     check = login_required('Medical')
     if check: return check
@@ -729,6 +933,7 @@ def medical_details():
 
 # -------- ADMIN --------
 @app.route('/admin',methods=['GET','POST'])
+@serialized_writes
 def admin():
     check=login_required("Admin")
     if check: return check
@@ -738,6 +943,17 @@ def admin():
         save_db(db)
     return render_template("admin_dashboard.html",users=db['users'])
 
+@app.route('/admin/reports')
+def admin_reports():
+    check=login_required("Admin")
+    if check: return check
+    # serve the cached build; rebuilding happens off the request path
+    age = reports.summary_age()
+    refreshing = False
+    if age is None or age > REPORT_MAX_AGE or request.args.get('refresh'):
+        refreshing = reports.refresh_async(db_path=DB)
+    return render_template("admin_reports.html", summary=reports.load_summary(), refreshing=refreshing)
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -745,4 +961,5 @@ def logout():
 
 # -------- RUN --------
 if __name__=="__main__":
+    warmup()
     app.run(debug=True)
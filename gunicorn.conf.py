@@ -0,0 +1,44 @@
+"""Gunicorn settings for HerHub.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Defaults to gevent workers, so idle police/SOS dashboards and slow clients
+hold a cheap greenlet instead of a whole worker. Set HERHUB_WORKER_CLASS=sync
+to fall back to plain sync workers. Every setting can be overridden from the
+environment.
+"""
+import multiprocessing, os
+
+bind = os.environ.get("HERHUB_BIND", "0.0.0.0:%s" % os.environ.get("PORT", "8000"))
+worker_class = os.environ.get("HERHUB_WORKER_CLASS", "gevent")
+
+if worker_class == "sync":
+    workers = int(os.environ.get("HERHUB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+    timeout = int(os.environ.get("HERHUB_TIMEOUT", 30))
+else:
+    # one evented worker per core; each holds many connections
+    workers = int(os.environ.get("HERHUB_WORKERS", multiprocessing.cpu_count()))
+    worker_connections = int(os.environ.get("HERHUB_WORKER_CONNECTIONS", 4000))
+    timeout = int(os.environ.get("HERHUB_TIMEOUT", 120))
+
+# keep idle dashboard connections open between polls
+keepalive = int(os.environ.get("HERHUB_KEEPALIVE", 75))
+graceful_timeout = int(os.environ.get("HERHUB_GRACEFUL_TIMEOUT", 30))
+
+# recycle workers now and then to cap memory growth
+max_requests = int(os.environ.get("HERHUB_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("HERHUB_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = os.environ.get("HERHUB_ACCESS_LOG", "-")
+errorlog = os.environ.get("HERHUB_ERROR_LOG", "-")
+
+
+def post_worker_init(worker):
+    # parse the DBs, build indexes and compile templates before this worker
+    # accepts connections, so /readyz only flips once it can serve fast
+    from app import warmup
+    try:
+        warmup()
+    except Exception:
+        # keep the worker up: /readyz reports the error and requests retry it
+        worker.log.exception("warmup failed")
@@ -0,0 +1,282 @@
+"""Offline reports over database.json.
+
+Run from the project root:
+
+    python reports.py            # incremental: only new or newly resolved records are read
+    python reports.py --full     # rebuild everything from scratch
+
+Outputs go to reports/ (summary.json plus one CSV per table). The same
+build is used by the /admin/reports page, in a background thread.
+
+Complaints and orders are append-only, and the only field that changes
+afterwards is a complaint's status (plus resolved_at). So the saved state
+is a high-water mark per list, running counts, and the indices of SOS
+complaints still pending; each run reads the records past the mark and
+re-checks just those pending indices.
+
+Orders are only attributed to a store when the order itself records one.
+/shop sells from the shared medicine list and does not store a store today,
+so orders_by_store shows them all as "Unassigned" rather than guessing one
+from medical_db.json.
+"""
+import argparse, csv, json, os, threading, time
+from collections import Counter
+from datetime import datetime
+
+DB = "database.json"
+REPORTS_DIR = "reports"
+STATE_FILE = "state.json"
+SUMMARY_FILE = "summary.json"
+TOP_MEDICINES = 10
+STATE_VERSION = 2  # bump when the saved state's layout or meaning changes
+
+COUNT_TABLES = {
+    # summary table -> running count it is read from
+    "complaints_by_station": "station",
+    "complaints_by_district": "district",
+    "complaints_by_state": "state",
+    "orders_by_store": "store",
+    "top_medicines": "medicine",
+}
+
+
+def _original(module, name, default):
+    # the unpatched stdlib object when running under gevent's monkey-patching
+    try:
+        from gevent import monkey
+    except ImportError:
+        return default
+    return monkey.get_original(module, name) if monkey.is_module_patched(module) else default
+
+
+# a real OS lock: it is released from the build thread, not the requesting greenlet
+_refresh_lock = _original('_thread', 'allocate_lock', threading.Lock)()
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _parse_ts(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def station_locations(db):
+    # station id -> [district, state], taken from police users' station logins.
+    # If several users logged in with the same station id, the first user in
+    # the DB (the earliest account) decides, so later logins can't move it.
+    locations = {}
+    for u in db.get('users', {}).values():
+        info = (u or {}).get('profile') or {}
+        info = info.get('station_info') if isinstance(info, dict) else None
+        if info and info.get('station_id'):
+            locations.setdefault(str(info['station_id']), [info.get('district') or 'Unknown', info.get('state') or 'Unknown'])
+    return locations
+
+
+def _empty_state(locations):
+    return {
+        "version": STATE_VERSION,
+        "locations": locations,
+        "complaints_seen": 0,
+        "orders_seen": 0,
+        "counts": {name: {} for name in COUNT_TABLES.values()},
+        "sos_pending": [],
+        "sos_seconds": [],
+        "sos_untimed": 0,
+    }
+
+
+def _load_state(path):
+    # a missing, truncated or foreign state file just means a full rebuild
+    try:
+        state = _read_json(path, None)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def _close_sos(state, c):
+    opened, closed = _parse_ts(c.get('created_at')), _parse_ts(c.get('resolved_at'))
+    if opened and closed:
+        state['sos_seconds'].append((closed - opened).total_seconds())
+    else:
+        state['sos_untimed'] += 1
+
+
+def _update_complaints(state, complaints, counts):
+    """Fold new complaints into the counts and close resolved SOS; returns records read."""
+    still_pending = []
+    for i in state['sos_pending']:
+        c = complaints[i]
+        if c.get('status') == 'Pending':
+            still_pending.append(i)
+        else:
+            _close_sos(state, c)
+    read = len(state['sos_pending']) - len(still_pending)
+
+    locations = state['locations']
+    for i in range(state['complaints_seen'], len(complaints)):
+        c = complaints[i]
+        counts['station'][c.get('station_name') or (str(c['station']) if c.get('station') else 'Unassigned')] += 1
+        district, st = locations.get(str(c.get('station')), ('Unknown', 'Unknown'))
+        counts['district'][district] += 1
+        counts['state'][st] += 1
+        if c.get('text') == 'SOS':
+            if c.get('status') == 'Pending':
+                still_pending.append(i)
+            else:
+                _close_sos(state, c)
+    read += len(complaints) - state['complaints_seen']
+
+    state['sos_pending'] = still_pending
+    state['complaints_seen'] = len(complaints)
+    return read
+
+
+def _update_orders(state, orders, counts):
+    for o in orders[state['orders_seen']:]:
+        med = o.get('medicine') or 'Unknown'
+        counts['store'][o.get('store') or 'Unassigned'] += 1
+        counts['medicine'][med] += 1
+    read = len(orders) - state['orders_seen']
+    state['orders_seen'] = len(orders)
+    return read
+
+
+def _sos_times(state):
+    times = sorted(state['sos_seconds'])
+    pending = len(state['sos_pending']) + state['sos_untimed']
+    if not times:
+        return {"resolved": 0, "unresolved_or_untimed": pending, "mean_seconds": None, "median_seconds": None, "max_seconds": None}
+    return {
+        "resolved": len(times),
+        "unresolved_or_untimed": pending,
+        "mean_seconds": round(sum(times) / len(times), 1),
+        "median_seconds": times[len(times) // 2],
+        "max_seconds": times[-1],
+    }
+
+
+def build(out_dir=REPORTS_DIR, db_path=DB, full=False):
+    """Build the reports, continuing from the previous run's state."""
+    db = _read_json(db_path, {})
+    complaints = db.get('complaints', [])
+    orders = db.get('orders', [])
+    locations = station_locations(db)
+
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = None if full else _load_state(state_path)
+    # a changed station table or shrunk lists invalidate the running counts
+    if (state is None or state['locations'] != locations
+            or state['complaints_seen'] > len(complaints) or state['orders_seen'] > len(orders)):
+        state = _empty_state(locations)
+
+    counts = {name: Counter(c) for name, c in state['counts'].items()}
+    read = {
+        "complaints": _update_complaints(state, complaints, counts),
+        "orders": _update_orders(state, orders, counts),
+    }
+    state['counts'] = {name: dict(c) for name, c in counts.items()}
+
+    summary = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "changed_records": read,
+        "totals": {"complaints": len(complaints), "orders": len(orders)},
+        "sos_response_times": _sos_times(state),
+    }
+    for table, name in COUNT_TABLES.items():
+        summary[table] = [{"key": k, "count": n} for k, n in counts[name].most_common()]
+    summary['top_medicines'] = summary['top_medicines'][:TOP_MEDICINES]
+
+    os.makedirs(out_dir, exist_ok=True)
+    for table in COUNT_TABLES:
+        _write_csv(os.path.join(out_dir, table + ".csv"), ["key", "count"],
+                   [(r['key'], r['count']) for r in summary[table]])
+    times = summary['sos_response_times']
+    _write_csv(os.path.join(out_dir, "sos_response_times.csv"), list(times), [list(times.values())])
+    _write_json(state_path, state)
+    _write_json(os.path.join(out_dir, SUMMARY_FILE), summary)
+    return summary
+
+
+def _tmp_path(path):
+    # unique per process and thread: several workers may build at once
+    return "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+
+
+def _write_json(path, data):
+    tmp = _tmp_path(path)
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, path)
+
+
+def _write_csv(path, header, rows):
+    tmp = _tmp_path(path)
+    with open(tmp, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+    os.replace(tmp, path)
+
+
+def load_summary(out_dir=REPORTS_DIR):
+    try:
+        return _read_json(os.path.join(out_dir, SUMMARY_FILE), None)
+    except ValueError:
+        return None
+
+
+def summary_age(out_dir=REPORTS_DIR):
+    path = os.path.join(out_dir, SUMMARY_FILE)
+    if not os.path.exists(path):
+        return None
+    return time.time() - os.path.getmtime(path)
+
+
+def refresh_async(out_dir=REPORTS_DIR, db_path=DB):
+    """Start a background build unless one is already running."""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            build(out_dir, db_path)
+        except (OSError, ValueError):
+            # DB caught mid-write; the next refresh will pick it up
+            pass
+        finally:
+            _refresh_lock.release()
+
+    # under gevent threading.Thread is a greenlet, and the build would stall
+    # every connection on the event loop; start a real OS thread instead
+    start_new_thread = _original('_thread', 'start_new_thread', None)
+    if start_new_thread is not None:
+        start_new_thread(run, ())
+    else:
+        threading.Thread(target=run, daemon=True).start()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build HerHub complaint and order reports.")
+    parser.add_argument('--out', default=REPORTS_DIR, help="output directory (default: reports)")
+    parser.add_argument('--db', default=DB, help="main database file")
+    parser.add_argument('--full', action='store_true', help="ignore cached state and rebuild everything")
+    args = parser.parse_args(argv)
+    summary = build(args.out, args.db, full=args.full)
+    print("Reports written to %s (%d complaints, %d orders read)" % (
+        args.out, summary['changed_records']['complaints'], summary['changed_records']['orders']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import contextlib, json, os, sys, threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'database.json')
+    with open(path, 'w') as f:
+        json.dump({"users": {"u": {"password": "", "role": "User", "profile": {}}},
+                   "complaints": [], "medicines": [], "orders": []}, f)
+    monkeypatch.setattr(app, 'DB', path)
+    return path
+
+
+def post_complaints(n):
+    start = threading.Barrier(n)
+
+    def post(i):
+        client = app.app.test_client()
+        with client.session_transaction() as s:
+            s['username'] = 'u'
+            s['role'] = 'User'
+        start.wait()
+        client.post('/safety/complaint', data={'text': 'report %d' % i, 'station': '1',
+                                               'idempotency_key': 'k%d' % i})
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_posts_keep_every_complaint(db_path):
+    post_complaints(30)
+    with open(db_path) as f:
+        assert len(json.load(f)['complaints']) == 30
+
+
+def test_posts_lose_updates_without_the_lock(db_path, monkeypatch):
+    # guards the test above: without db_lock the same load lost records
+    monkeypatch.setattr(app, 'db_lock', contextlib.nullcontext)
+    post_complaints(30)
+    with open(db_path) as f:
+        assert len(json.load(f)['complaints']) < 30
+
+
+@pytest.mark.skipif(app.fcntl is None, reason="flock needs fcntl")
+def test_db_lock_is_reentrant_and_releases_flock(db_path):
+    def flock_free():
+        with open(db_path + '.lock', 'a') as f:
+            try:
+                app.fcntl.flock(f.fileno(), app.fcntl.LOCK_EX | app.fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            app.fcntl.flock(f.fileno(), app.fcntl.LOCK_UN)
+            return True
+
+    with app.db_lock():
+        with app.db_lock():
+            assert not flock_free()
+        # leaving the inner block must not drop the outer holder's flock
+        assert not flock_free()
+    assert flock_free()
+    assert app._db_lock_state == {'depth': 0, 'file': None}
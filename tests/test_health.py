@@ -0,0 +1,71 @@
+import json, os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'DB', str(tmp_path / 'database.json'))
+    monkeypatch.setattr(app, 'MEDICAL_DB', str(tmp_path / 'medical_db.json'))
+    monkeypatch.setattr(app, '_warm', {'ready': False, 'warmed_at': None, 'seconds': None,
+                                       'error': None, 'failed_at': None})
+    return app.app.test_client()
+
+
+def test_healthz_is_live_without_warming_up(client):
+    r = client.get('/healthz')
+    assert r.status_code == 200
+    assert r.get_json() == {'status': 'ok'}
+    assert not app._warm['ready']
+
+
+def test_readyz_flips_to_ready_once_warmed(client):
+    # another request holding the warmup lock means warmup is still running
+    with app._warmup_lock:
+        r = client.get('/readyz')
+        assert r.status_code == 503
+        assert r.get_json()['status'] == 'warming'
+    r = client.get('/readyz')
+    assert r.status_code == 200
+    assert r.get_json()['status'] == 'ready'
+    assert r.get_json()['warmed_at']
+
+
+def test_data_version_changes_after_save(client):
+    app.save_db({"users": {}, "complaints": [], "medicines": [], "orders": []})
+    before = client.get('/readyz').get_json()['data_version']
+    db = app.load_db()
+    db['complaints'].append({'user': 'u', 'text': 'SOS', 'status': 'Pending'})
+    app.save_db(db)
+    assert client.get('/readyz').get_json()['data_version'] != before
+
+
+def test_failed_warmup_is_reported_and_not_retried_every_request(client, monkeypatch):
+    calls = []
+    build_indexes = app.build_indexes
+
+    def broken():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("broken template")
+        build_indexes()
+
+    monkeypatch.setattr(app, 'build_indexes', broken)
+    r = client.get('/readyz')
+    assert r.status_code == 503
+    assert r.get_json()['status'] == 'failed'
+    assert 'broken template' in r.get_json()['error']
+    client.get('/readyz')
+    client.get('/login')
+    assert len(calls) == 1
+
+    # once the back-off has passed, the next request tries again
+    app._warm['failed_at'] -= app.WARMUP_RETRY_AFTER
+    r = client.get('/readyz')
+    assert r.status_code == 200
+    assert r.get_json()['error'] is None
+    assert len(calls) == 2
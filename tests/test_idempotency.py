@@ -0,0 +1,36 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import add_complaint
+
+
+def empty_db():
+    return {"users": {}, "complaints": [], "medicines": [], "orders": []}
+
+
+def test_replayed_key_is_not_written_again():
+    db = empty_db()
+    assert add_complaint(db, 'u', 'SOS', None, 'k1')[1] == 'created'
+    assert add_complaint(db, 'u', 'SOS', None, 'k1')[1] == 'replayed'
+    assert len(db['complaints']) == 1
+    assert db['complaints'][0]['repeat_count'] == 1
+
+
+def test_replay_of_merged_key_does_not_count_again():
+    db = empty_db()
+    add_complaint(db, 'u', 'SOS', None, 'k1')
+    assert add_complaint(db, 'u', 'SOS', None, 'k2')[1] == 'merged'
+    record, outcome = add_complaint(db, 'u', 'SOS', None, 'k2')
+    assert outcome == 'replayed'
+    assert record['repeat_count'] == 2
+    assert len(db['complaints']) == 1
+
+
+def test_distinct_reports_are_kept():
+    db = empty_db()
+    add_complaint(db, 'u', 'broken light', '1', 'k1')
+    add_complaint(db, 'u', 'harassment', '1', 'k2')
+    add_complaint(db, 'v', 'SOS', None, 'k3')
+    add_complaint(db, 'u', 'SOS', '2', 'k4')
+    assert len(db['complaints']) == 4
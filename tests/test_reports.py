@@ -0,0 +1,114 @@
+import json, os, random, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reports
+
+
+def police(station_id, district, state):
+    info = {'station_id': station_id, 'district': district, 'state': state}
+    return {'password': '', 'role': 'Police', 'profile': {'station_info': info}}
+
+
+def complaint(i, rng):
+    sos = rng.random() < 0.4
+    return {'user': 'u%d' % (i % 7), 'text': 'SOS' if sos else 'text %d' % i,
+            'station': str(rng.randint(1, 4)), 'station_name': None,
+            'status': 'Pending', 'created_at': '2026-10-01T10:00:00'}
+
+
+def write_db(path, db):
+    with open(path, 'w') as f:
+        json.dump(db, f)
+
+
+def comparable(summary):
+    return {k: v for k, v in summary.items() if k not in ('generated_at', 'changed_records')}
+
+
+def full_build(tmp_path, db_path):
+    return reports.build(str(tmp_path / 'full'), db_path, full=True)
+
+
+def test_incremental_matches_full_build(tmp_path):
+    rng = random.Random(7)
+    db_path = str(tmp_path / 'database.json')
+    out = str(tmp_path / 'out')
+    db = {'users': {'p1': police('1', 'D1', 'S1'), 'p2': police('2', 'D2', 'S1')},
+          'complaints': [], 'medicines': [], 'orders': []}
+    for _ in range(30):
+        for _ in range(rng.randint(0, 20)):
+            db['complaints'].append(complaint(len(db['complaints']), rng))
+        for _ in range(rng.randint(0, 5)):
+            db['orders'].append({'user': 'u', 'medicine': rng.choice(['dolo', 'paracetamol'])})
+        for c in db['complaints']:
+            if c['status'] == 'Pending' and rng.random() < 0.2:
+                c['status'] = 'Resolved'
+                # some legacy records have no resolved_at and count as untimed
+                if rng.random() < 0.8:
+                    c['resolved_at'] = '2026-10-01T10:0%d:00' % rng.randint(1, 9)
+        write_db(db_path, db)
+        incremental = reports.build(out, db_path)
+        assert comparable(incremental) == comparable(full_build(tmp_path, db_path))
+
+
+def test_unchanged_run_reads_nothing(tmp_path):
+    db_path = str(tmp_path / 'database.json')
+    write_db(db_path, {'users': {}, 'orders': [{'user': 'u', 'medicine': 'dolo'}],
+                       'complaints': [complaint(i, random.Random(i)) for i in range(5)]})
+    out = str(tmp_path / 'out')
+    reports.build(out, db_path)
+    assert reports.build(out, db_path)['changed_records'] == {'complaints': 0, 'orders': 0}
+
+
+def test_state_resets_when_list_shrinks(tmp_path):
+    rng = random.Random(1)
+    db_path = str(tmp_path / 'database.json')
+    out = str(tmp_path / 'out')
+    db = {'users': {}, 'orders': [], 'complaints': [complaint(i, rng) for i in range(10)]}
+    write_db(db_path, db)
+    reports.build(out, db_path)
+    del db['complaints'][4:]
+    write_db(db_path, db)
+    summary = reports.build(out, db_path)
+    assert summary['changed_records']['complaints'] == 4
+    assert comparable(summary) == comparable(full_build(tmp_path, db_path))
+
+
+def test_state_resets_when_station_table_changes(tmp_path):
+    rng = random.Random(2)
+    db_path = str(tmp_path / 'database.json')
+    out = str(tmp_path / 'out')
+    db = {'users': {'p1': police('1', 'D1', 'S1')}, 'orders': [],
+          'complaints': [complaint(i, rng) for i in range(10)]}
+    write_db(db_path, db)
+    reports.build(out, db_path)
+    db['users']['p1'] = police('1', 'Elsewhere', 'S9')
+    write_db(db_path, db)
+    summary = reports.build(out, db_path)
+    assert summary['changed_records']['complaints'] == 10
+    assert comparable(summary) == comparable(full_build(tmp_path, db_path))
+
+
+def test_unreadable_state_falls_back_to_full_build(tmp_path):
+    rng = random.Random(3)
+    db_path = str(tmp_path / 'database.json')
+    out = str(tmp_path / 'out')
+    write_db(db_path, {'users': {}, 'orders': [], 'complaints': [complaint(i, rng) for i in range(6)]})
+    reports.build(out, db_path)
+    state_path = os.path.join(out, reports.STATE_FILE)
+    for broken in ('{"counts": {', '[]', '{"counts": {}}'):
+        with open(state_path, 'w') as f:
+            f.write(broken)
+        summary = reports.build(out, db_path)
+        assert summary['changed_records']['complaints'] == 6
+        assert comparable(summary) == comparable(full_build(tmp_path, db_path))
+
+
+def test_orders_without_store_are_unassigned(tmp_path):
+    db_path = str(tmp_path / 'database.json')
+    write_db(db_path, {'users': {}, 'complaints': [],
+                       'orders': [{'user': 'u', 'medicine': 'dolo'},
+                                  {'user': 'u', 'medicine': 'dolo', 'store': 'true meds'}]})
+    summary = reports.build(str(tmp_path / 'out'), db_path)
+    assert summary['orders_by_store'] == [{'key': 'Unassigned', 'count': 1}, {'key': 'true meds', 'count': 1}]